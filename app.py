@@ -8,313 +8,41 @@ Combines Gradio UI with FastAPI endpoints for Render deployment
 
 import os
 import sys
-import gradio as gr
-from fastapi import FastAPI, HTTPException, Header, Depends
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-import uvicorn
-from datetime import datetime
-from typing import Optional
-import json
-import traceback
+from fastapi.responses import ORJSONResponse
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import original functionality
-# Note: Ye imports aapki original files se hain
-try:
-    from generate import generate_song, generate_pure_music
-    GENERATION_AVAILABLE = True
-except ImportError:
-    print("Warning: Could not import generation functions. Using dummy mode.")
-    GENERATION_AVAILABLE = False
-    
-    # Dummy functions for testing
-    def generate_song(lyrics, genre="Auto", **kwargs):
-        return None, {"status": "dummy", "message": "Generation not available"}
-    
-    def generate_pure_music(prompt, genre="Auto", **kwargs):
-        return None, {"status": "dummy", "message": "Generation not available"}
-
-# ======================
-# FastAPI Setup
-# ======================
-
-api = FastAPI(
-    title="SongGeneration API",
-    description="AI-powered music generation API",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc"
-)
-
-# CORS middleware
-api.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from routes import (
+    register,
+    generate_song,
+    generate_pure_music,
+    run_generation,
+    GEN_EXECUTOR,
+    GENERATION_AVAILABLE,
+    GENRES,
+    OUTPUT_DIR,
+    CACHE_DIR,
+    MODEL_DTYPE,
+    MODEL_QUANT,
+    MODEL_COMPILE,
+    ENABLE_CACHE_CLEANING,
+    ENABLE_GRADIO
 )
 
-# ======================
-# Configuration
-# ======================
-
-OUTPUT_DIR = os.path.join(os.getcwd(), "outputs")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-CACHE_DIR = os.environ.get("TRANSFORMERS_CACHE", "./cache")
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-# Optional API Key
-API_KEY = os.environ.get("API_KEY", None)
-
-# ======================
-# Helper Functions
-# ======================
-
-async def verify_api_key(x_api_key: str = Header(None)):
-    """Verify API key if configured"""
-    if API_KEY and x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid or missing API Key")
-    return True
-
-def save_audio_file(audio_data, filename):
-    """Save audio file to outputs directory"""
-    if audio_data is None:
-        return None
-    
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    # Assuming audio_data is a file path or audio object
-    # Adjust based on actual return type
-    return filepath
-
-# ======================
-# API Endpoints
-# ======================
-
-@api.get("/")
-async def root():
-    """API information"""
-    return {
-        "service": "SongGeneration API",
-        "version": "1.0.0",
-        "status": "running",
-        "generation_available": GENERATION_AVAILABLE,
-        "endpoints": {
-            "health": "/api/health",
-            "generate_song": "/api/generate",
-            "generate_music": "/api/generate-music",
-            "genres": "/api/genres",
-            "docs": "/docs",
-            "gradio": "/gradio"
-        },
-        "timestamp": datetime.now().isoformat()
-    }
-
-@api.get("/api/health")
-async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "SongGeneration API",
-        "generation_available": GENERATION_AVAILABLE,
-        "output_dir": OUTPUT_DIR,
-        "cache_dir": CACHE_DIR,
-        "timestamp": datetime.now().isoformat()
-    }
-
-@api.post("/api/generate")
-async def generate_song_api(
-    lyrics: str,
-    genre: str = "Auto",
-    audio_prompt: Optional[str] = None,
-    text_prompt: Optional[str] = None,
-    seed: int = -1,
-    api_key_valid: bool = Depends(verify_api_key)
-):
-    """
-    Generate a song from lyrics
-    
-    Parameters:
-    - lyrics: Song lyrics with structure tags ([intro], [verse], [chorus], etc.)
-    - genre: Music genre (Auto, Pop, Rock, Chinese Style, etc.)
-    - audio_prompt: Optional audio file for style reference
-    - text_prompt: Optional text description
-    - seed: Random seed (-1 for random)
-    """
-    try:
-        if not lyrics or len(lyrics.strip()) == 0:
-            raise HTTPException(status_code=400, detail="Lyrics cannot be empty")
-        
-        if not GENERATION_AVAILABLE:
-            raise HTTPException(
-                status_code=503, 
-                detail="Song generation service not available. Models may be loading."
-            )
-        
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"song_{timestamp}.wav"
-        
-        # Call generation function
-        try:
-            audio_output, info = generate_song(
-                lyrics=lyrics,
-                genre=genre,
-                audio_prompt=audio_prompt,
-                text_prompt=text_prompt,
-                seed=seed
-            )
-            
-            # Save audio file
-            if audio_output:
-                output_path = os.path.join(OUTPUT_DIR, output_filename)
-                # Save logic depends on what generate_song returns
-                # Assuming it returns a file path or needs to be saved
-                
-                return {
-                    "status": "success",
-                    "message": "Song generated successfully",
-                    "data": {
-                        "audio_url": f"/outputs/{output_filename}",
-                        "filename": output_filename,
-                        "genre": genre,
-                        "info": info if isinstance(info, dict) else {},
-                        "lyrics_preview": lyrics[:100] + "..." if len(lyrics) > 100 else lyrics
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Generation failed")
-                
-        except Exception as gen_error:
-            print(f"Generation error: {gen_error}")
-            traceback.print_exc()
-            raise HTTPException(
-                status_code=500,
-                detail=f"Generation failed: {str(gen_error)}"
-            )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
-
-@api.post("/api/generate-music")
-async def generate_music_api(
-    text_prompt: str,
-    genre: str = "Auto",
-    duration: int = 180,
-    seed: int = -1,
-    api_key_valid: bool = Depends(verify_api_key)
-):
-    """
-    Generate instrumental music without lyrics
-    """
-    try:
-        if not text_prompt or len(text_prompt.strip()) == 0:
-            raise HTTPException(status_code=400, detail="Text prompt cannot be empty")
-        
-        if not GENERATION_AVAILABLE:
-            raise HTTPException(
-                status_code=503,
-                detail="Music generation service not available"
-            )
-        
-        if duration > 300:
-            raise HTTPException(status_code=400, detail="Duration max 300 seconds")
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_filename = f"music_{timestamp}.wav"
-        
-        try:
-            audio_output, info = generate_pure_music(
-                prompt=text_prompt,
-                genre=genre,
-                duration=duration,
-                seed=seed
-            )
-            
-            if audio_output:
-                return {
-                    "status": "success",
-                    "message": "Music generated successfully",
-                    "data": {
-                        "audio_url": f"/outputs/{output_filename}",
-                        "filename": output_filename,
-                        "genre": genre,
-                        "duration": duration,
-                        "prompt": text_prompt
-                    },
-                    "timestamp": datetime.now().isoformat()
-                }
-            else:
-                raise HTTPException(status_code=500, detail="Generation failed")
-                
-        except Exception as gen_error:
-            raise HTTPException(status_code=500, detail=str(gen_error))
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api.get("/outputs/{filename}")
-async def download_audio(filename: str):
-    """Download generated audio file"""
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    
-    if not os.path.exists(filepath):
-        raise HTTPException(status_code=404, detail="Audio file not found")
-    
-    return FileResponse(
-        filepath,
-        media_type="audio/wav",
-        filename=filename
-    )
-
-@api.get("/api/genres")
-async def get_genres():
-    """Get available music genres"""
-    genres = [
-        "Auto",
-        "Pop",
-        "R&B",
-        "Dance",
-        "Jazz",
-        "Rock",
-        "Chinese Style",
-        "Chinese Tradition",
-        "Metal",
-        "Reggae",
-        "Chinese Opera"
-    ]
-    return {"status": "success", "genres": genres, "count": len(genres)}
-
-@api.exception_handler(HTTPException)
-async def http_exception_handler(request, exc):
-    """Custom HTTP exception handler"""
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={
-            "status": "error",
-            "message": exc.detail,
-            "timestamp": datetime.now().isoformat()
-        }
-    )
-
 # ======================
 # Gradio Interface
 # ======================
 
+def run_ui_generation(fn, *args, **kwargs):
+    """Run a UI job on the API's generation pool so both share its per-GPU worker limit"""
+    return GEN_EXECUTOR.submit(run_generation, fn, *args, **kwargs).result()
+
 def create_gradio_interface():
     """Create Gradio UI interface"""
+    import gradio as gr
     
     # Lyrics input guidelines
     lyrics_guide = """
@@ -363,9 +91,7 @@ def create_gradio_interface():
                         lines=15
                     )
                     genre_dropdown = gr.Dropdown(
-                        choices=["Auto", "Pop", "R&B", "Dance", "Jazz", "Rock", 
-                                "Chinese Style", "Chinese Tradition", "Metal", 
-                                "Reggae", "Chinese Opera"],
+                        choices=list(GENRES),
                         value="Auto",
                         label="Genre"
                     )
@@ -377,7 +103,7 @@ def create_gradio_interface():
                     info_output = gr.JSON(label="Generation Info")
             
             generate_btn.click(
-                fn=lambda l, g, s: generate_song(l, g, seed=s) if GENERATION_AVAILABLE else (None, {"error": "Not available"}),
+                fn=lambda l, g, s: run_ui_generation(generate_song, l, g, seed=s) if GENERATION_AVAILABLE else (None, {"error": "Not available"}),
                 inputs=[lyrics_input, genre_dropdown, seed_input],
                 outputs=[audio_output, info_output]
             )
@@ -412,7 +138,7 @@ def create_gradio_interface():
                     music_info = gr.JSON(label="Generation Info")
             
             generate_music_btn.click(
-                fn=lambda p, g, d, s: generate_pure_music(p, g, duration=d, seed=s) if GENERATION_AVAILABLE else (None, {"error": "Not available"}),
+                fn=lambda p, g, d, s: run_ui_generation(generate_pure_music, p, g, duration=d, seed=s) if GENERATION_AVAILABLE else (None, {"error": "Not available"}),
                 inputs=[prompt_input, music_genre, duration_input, music_seed],
                 outputs=[music_output, music_info]
             )
@@ -426,6 +152,7 @@ def create_gradio_interface():
             ### Endpoints:
             - `GET /api/health` - Health check
             - `POST /api/generate` - Generate song from lyrics
+            - `POST /api/generate/stream` - Generate song, WAV streamed once fully decoded (no lower latency than `/api/generate`)
             - `POST /api/generate-music` - Generate instrumental music
             - `GET /api/genres` - Get available genres
             - `GET /outputs/{{filename}}` - Download audio file
@@ -440,40 +167,80 @@ def create_gradio_interface():
     
     return demo
 
-# Create Gradio interface
-demo = create_gradio_interface()
-
-# Mount Gradio app with FastAPI
-app = gr.mount_gradio_app(api, demo, path="/gradio")
+# ======================
+# App Factory
+# ======================
 
-# Mount static files for outputs
-if os.path.exists(OUTPUT_DIR):
-    api.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
+def create_app():
+    """Build the FastAPI app, with the Gradio UI mounted if enabled"""
+    api = FastAPI(
+        title="SongGeneration API",
+        description="AI-powered music generation API",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        default_response_class=ORJSONResponse
+    )
+    
+    # CORS middleware
+    api.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    register(api)
+    
+    if not ENABLE_GRADIO:
+        return api
+    
+    # Create Gradio interface and mount it with FastAPI
+    import gradio as gr
+    demo = create_gradio_interface()
+    return gr.mount_gradio_app(api, demo, path="/gradio")
 
 # ======================
 # Server Start
 # ======================
 
 if __name__ == "__main__":
+    import uvicorn
+    
     port = int(os.environ.get("PORT", 10000))
     host = os.environ.get("HOST", "0.0.0.0")
-    
-    print("=" * 60)
-    print("🚀 SongGeneration API Server Starting...")
-    print("=" * 60)
-    print(f"📍 Host: {host}")
-    print(f"🔌 Port: {port}")
-    print(f"📁 Cache: {CACHE_DIR}")
-    print(f"📁 Output: {OUTPUT_DIR}")
-    print(f"🎵 Generation: {'Available' if GENERATION_AVAILABLE else 'Not Available (Models Loading...)'}")
-    print(f"🌐 API Docs: http://{host}:{port}/docs")
-    print(f"🎨 Gradio UI: http://{host}:{port}/gradio")
-    print("=" * 60)
+    # Every worker is a full copy of the app, models included; keep 1 per GPU
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    
+    # One write for the whole banner
+    banner = (
+        "=" * 60,
+        "🚀 SongGeneration API Server Starting...",
+        "=" * 60,
+        f"📍 Host: {host}",
+        f"🔌 Port: {port}",
+        f"👷 Workers: {workers}",
+        f"📁 Cache: {CACHE_DIR}",
+        f"📁 Output: {OUTPUT_DIR}",
+        f"🧮 Model: {MODEL_DTYPE} (quant: {MODEL_QUANT}, compile: {'on' if MODEL_COMPILE else 'off'})",
+        f"🧠 CUDA alloc: {os.environ.get('PYTORCH_CUDA_ALLOC_CONF')} (cache cleaning {'on' if ENABLE_CACHE_CLEANING else 'off'})",
+        f"🎵 Generation: {'Available' if GENERATION_AVAILABLE else 'Not Available (Models Loading...)'}",
+        f"🌐 API Docs: http://{host}:{port}/docs",
+        f"🎨 Gradio UI: {f'http://{host}:{port}/gradio' if ENABLE_GRADIO else 'disabled'}",
+        "=" * 60,
+    )
+    sys.stdout.write("\n".join(banner) + "\n")
+    sys.stdout.flush()
     
     uvicorn.run(
-        app,
+        "app:create_app",
+        factory=True,
         host=host,
         port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
         log_level="info",
         access_log=True
     )
@@ -4,35 +4,112 @@ Ye file dikhaati hai ke kaise API ko use karein
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
-from typing import Optional
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Tuple, Union
 
 class SongGenerationClient:
     """Client for SongGeneration API"""
     
-    def __init__(self, base_url: str, api_key: Optional[str] = None):
+    # Path of aria2c/curl, looked up once on first native download
+    _native_downloader = None
+    
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: Union[float, Tuple[float, float]] = (10, 300)
+    ):
         """
         Initialize client
         
         Args:
             base_url: API server ka URL (e.g., https://your-app.onrender.com)
             api_key: Optional API key for authentication
+            timeout: (connect, read) seconds applied to every request
         """
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
+        self.default_timeout = timeout
         self.headers = {
             "Content-Type": "application/json"
         }
         
         if api_key:
             self.headers["X-API-Key"] = api_key
+        
+        # Genre list is static on the server; refresh it hourly at most
+        self._genres_cache = None
+        self._genres_cache_ts = 0
+        self.genres_ttl = 3600
+        
+        # Wall-clock limit for one aria2c/curl download before falling back to Python
+        self.native_timeout = 600
+        
+        # (monotonic time, last health response); reused for _health_ttl seconds
+        self._health_cache = (0.0, None)
+        self._health_ttl = 2.0
+        self._health_etag = None
+        
+        # Reuse connections (keep-alive) across all calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Only idempotent calls are resent after a timeout or 5xx; a resent
+        # POST /api/generate would start another full GPU job. Exhausted
+        # retries return the last response so callers still see its status/body.
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=2,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
     
     def health_check(self):
-        """Check if API is healthy"""
+        """Check if API is healthy (cached briefly, revalidated with ETag if offered)"""
+        now = time.monotonic()
+        cached_at, cached = self._health_cache
+        if cached is not None and now - cached_at < self._health_ttl:
+            return cached
+        
         try:
-            response = requests.get(f"{self.base_url}/api/health")
-            return response.json()
+            headers = {"If-None-Match": self._health_etag} if self._health_etag and cached is not None else {}
+            response = self.session.get(
+                f"{self.base_url}/api/health",
+                headers=headers,
+                timeout=self.default_timeout
+            )
+            if response.status_code == 304:
+                self._health_cache = (now, cached)
+                return cached
+            
+            result = response.json()
+            if response.status_code == 200:
+                self._health_etag = response.headers.get("ETag")
+                self._health_cache = (now, result)
+            return result
         except Exception as e:
             return {"status": "error", "message": str(e)}
     
@@ -72,11 +149,10 @@ class SongGenerationClient:
             payload["text_prompt"] = text_prompt
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 json=payload,
-                headers=self.headers,
-                timeout=300  # 5 minutes timeout
+                timeout=self.default_timeout
             )
             
             if response.status_code == 200:
@@ -122,11 +198,10 @@ class SongGenerationClient:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 json=payload,
-                headers=self.headers,
-                timeout=300
+                timeout=self.default_timeout
             )
             
             if response.status_code == 200:
@@ -143,31 +218,145 @@ class SongGenerationClient:
                 "message": str(e)
             }
     
-    def download_audio(self, audio_url: str, output_path: str):
+    @classmethod
+    def _find_native_downloader(cls):
+        """Path of aria2c (preferred) or curl, or '' if neither is installed"""
+        if cls._native_downloader is None:
+            cls._native_downloader = shutil.which("aria2c") or shutil.which("curl") or ""
+        return cls._native_downloader
+    
+    def _download_native(self, audio_url: str, output_path: str):
+        """Download with aria2c/curl; returns True on success"""
+        binary = self._find_native_downloader()
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        if not binary or not os.access(output_dir, os.W_OK):
+            return False
+        
+        headers = [f"{k}: {v}" for k, v in self.headers.items() if k != "Content-Type"]
+        is_aria2c = os.path.basename(binary).startswith("aria2c")
+        if is_aria2c:
+            cmd = [binary, "-x", "8", "-s", "8", "-k", "1M", "-q",
+                   "--allow-overwrite=true", "--auto-file-renaming=false",
+                   "-d", output_dir, "-o", os.path.basename(output_path)]
+        else:
+            cmd = [binary, "-fsSL", "-o", output_path]
+        
+        # Headers (the API key) go through a private file, not argv, which any
+        # local user can read via ps or /proc/*/cmdline
+        header_file = None
+        try:
+            if headers:
+                with tempfile.NamedTemporaryFile("w", suffix=".conf", delete=False) as f:
+                    header_file = f.name
+                    if is_aria2c:
+                        f.writelines(f"header={h}\n" for h in headers)
+                    else:
+                        f.writelines(f"{h}\n" for h in headers)
+                cmd += [f"--conf-path={header_file}"] if is_aria2c else ["-H", f"@{header_file}"]
+            
+            subprocess.run(cmd + [audio_url], check=True, timeout=self.native_timeout)
+            return True
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+            return False
+        finally:
+            if header_file:
+                os.unlink(header_file)
+    
+    def download_audio(self, audio_url: str, output_path: str, use_native: bool = False):
         """
         Download generated audio file
         
         Args:
             audio_url: URL returned from generate_song
             output_path: Local path to save file
+            use_native: Try aria2c/curl first, falling back to Python on failure
         """
         try:
             # If relative URL, make it absolute
             if audio_url.startswith('/'):
                 audio_url = f"{self.base_url}{audio_url}"
             
-            response = requests.get(audio_url, stream=True)
-            
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            if use_native and self._download_native(audio_url, output_path):
                 return {"status": "success", "path": output_path}
-            else:
-                return {
-                    "status": "error",
-                    "message": "Failed to download audio"
-                }
+            
+            with self.session.get(audio_url, stream=True, timeout=self.default_timeout) as response:
+                if response.status_code != 200:
+                    return {
+                        "status": "error",
+                        "message": "Failed to download audio"
+                    }
+                
+                # Copy socket -> file in 1 MiB blocks without a Python chunk loop
+                response.raw.decode_content = True
+                with open(output_path, 'wb', buffering=1024 * 1024) as f:
+                    shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+            return {"status": "success", "path": output_path}
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+    
+    def _download_range(self, audio_url: str, output_path: str, start: int, end: int):
+        """Fetch bytes start..end (inclusive) into the same offset of output_path"""
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.session.get(audio_url, headers=headers, stream=True, timeout=self.default_timeout) as response:
+            if response.status_code != 206:
+                raise IOError(f"Range request failed with status {response.status_code}")
+            with open(output_path, 'r+b', buffering=1024 * 1024) as f:
+                f.seek(start)
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+    
+    def download_audio_parallel(
+        self,
+        audio_url: str,
+        output_path: str,
+        num_chunks: int = 4,
+        min_size: int = 8 * 1024 * 1024
+    ):
+        """
+        Download a large audio file with concurrent HTTP Range requests
+        
+        Falls back to download_audio when the server doesn't advertise
+        byte ranges or the file is smaller than min_size.
+        
+        Args:
+            audio_url: URL returned from generate_song
+            output_path: Local path to save file
+            num_chunks: Number of parallel range requests
+            min_size: Smallest file (bytes) worth splitting
+        """
+        try:
+            if audio_url.startswith('/'):
+                audio_url = f"{self.base_url}{audio_url}"
+            
+            head = self.session.head(audio_url, timeout=self.default_timeout)
+            size = int(head.headers.get("Content-Length", 0))
+            if (head.status_code != 200
+                    or head.headers.get("Accept-Ranges") != "bytes"
+                    or size < min_size):
+                return self.download_audio(audio_url, output_path)
+            
+            # Keep each range >= 512 KiB so per-request overhead stays small
+            num_chunks = max(1, min(num_chunks, size // (512 * 1024)))
+            chunk = -(-size // num_chunks)
+            ranges = [(start, min(start + chunk, size) - 1) for start in range(0, size, chunk)]
+            
+            # Pre-size the file so every range can write at its own offset
+            with open(output_path, 'wb') as f:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(f.fileno(), 0, size)
+                else:
+                    f.truncate(size)
+            
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [
+                    executor.submit(self._download_range, audio_url, output_path, start, end)
+                    for start, end in ranges
+                ]
+                for future in futures:
+                    future.result()
+            return {"status": "success", "path": output_path}
         except Exception as e:
             return {
                 "status": "error",
@@ -175,10 +364,17 @@ class SongGenerationClient:
             }
     
     def get_genres(self):
-        """Get list of available genres"""
+        """Get list of available genres (cached for genres_ttl seconds)"""
+        if self._genres_cache is not None and time.time() - self._genres_cache_ts < self.genres_ttl:
+            return self._genres_cache
+        
         try:
-            response = requests.get(f"{self.base_url}/api/genres")
-            return response.json()
+            response = self.session.get(f"{self.base_url}/api/genres", timeout=self.default_timeout)
+            result = response.json()
+            if result.get("status") == "success":
+                self._genres_cache = result
+                self._genres_cache_ts = time.time()
+            return result
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
@@ -254,8 +450,15 @@ def example_generate_music():
     print("Music Generation:", json.dumps(result, indent=2))
 
 
-def example_batch_generation():
-    """Example: Generate multiple songs"""
+def example_batch_generation(server_workers: int = 1):
+    """
+    Example: Generate multiple songs
+    
+    Args:
+        server_workers: Songs the server generates at once (its GEN_WORKERS).
+            Sending more than this only queues them on the server, where the
+            later ones can outlast the client's read timeout.
+    """
     
     client = SongGenerationClient(
         base_url="https://your-app.onrender.com"
@@ -275,22 +478,34 @@ def example_batch_generation():
         }
     ]
     
-    for i, item in enumerate(lyrics_list):
-        print(f"\nGenerating song {i+1}/{len(lyrics_list)}...")
-        
-        result = client.generate_song(
-            lyrics=item["lyrics"],
-            genre=item["genre"]
-        )
+    # Up to server_workers songs generate at once; each download starts as soon as its song is ready
+    print(f"\nGenerating {len(lyrics_list)} songs...")
+    with ThreadPoolExecutor(max_workers=max(1, min(server_workers, len(lyrics_list)))) as generator, \
+            ThreadPoolExecutor(max_workers=min(8, len(lyrics_list))) as executor:
+        generations = {
+            generator.submit(client.generate_song, lyrics=item["lyrics"], genre=item["genre"]): item
+            for item in lyrics_list
+        }
         
-        if result.get("status") == "success":
-            audio_url = result["data"]["audio_url"]
-            output_path = f"{item['name']}.wav"
+        downloads = {}
+        for future in as_completed(generations):
+            item = generations[future]
+            result = future.result()
             
-            client.download_audio(audio_url, output_path)
-            print(f"✓ {item['name']} generated and saved")
-        else:
-            print(f"✗ {item['name']} failed:", result.get("message"))
+            if result.get("status") == "success":
+                audio_url = result["data"]["audio_url"]
+                output_path = f"{item['name']}.wav"
+                
+                downloads[executor.submit(client.download_audio, audio_url, output_path)] = item
+            else:
+                print(f"✗ {item['name']} failed:", result.get("message"))
+        
+        for future in as_completed(downloads):
+            item = downloads[future]
+            if future.result().get("status") == "success":
+                print(f"✓ {item['name']} generated and saved")
+            else:
+                print(f"✗ {item['name']} download failed:", future.result().get("message"))
 
 
 def example_with_error_handling():
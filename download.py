@@ -1,6 +1,12 @@
-from huggingface_hub import snapshot_download
+import importlib.util
 import os
 
+# Rust-backed parallel downloader; must be enabled before huggingface_hub is imported
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+from huggingface_hub import snapshot_download
+
 os.environ["HF_HUB_DOWNLOAD_TIMEOUT"] = "1200"
 # os.environ["HF_ENDPOINT"] = "https://hf-mirror.com" 
 
@@ -10,10 +16,12 @@ def download_model(local_dir, repo_id="tencent/SongGeneration", revision="87bccf
         local_dir=local_dir,
         revision=revision,
         token=os.environ.get("HF_TOKEN"), 
-        ignore_patterns=['.git*']
+        ignore_patterns=['.git*'],
+        max_workers=16,
+        etag_timeout=30
     )
     print(f"File downloaded to:{downloaded_path}")
 
 
 if __name__ == '__main__':
-    download_model('.')
\ No newline at end of file
+    download_model('.')
@@ -18,6 +18,46 @@ import re
 
 auto_prompt_type = ['Pop', 'R&B', 'Dance', 'Jazz', 'Folk', 'Rock', 'Chinese Style', 'Chinese Tradition', 'Metal', 'Reggae', 'Chinese Opera', 'Auto']
 
+model_dtypes = {'fp32': torch.float32, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+model_config = {'dtype': torch.float16, 'quant': 'none', 'compile': False}
+
+def configure_model(dtype=torch.float16, quant='none', compile=False):
+    if isinstance(dtype, str):
+        if dtype not in model_dtypes:
+            raise ValueError(f"model dtype {dtype!r} not supported, expected one of {', '.join(model_dtypes)}")
+        dtype = model_dtypes[dtype]
+    if quant not in ['none', 'int8']:
+        raise ValueError(f"model quant {quant!r} not supported, expected 'none' or 'int8'")
+    if quant == 'int8':
+        # Optional dependency; check now rather than when the model loads
+        try:
+            import bitsandbytes  # noqa: F401
+        except ImportError:
+            raise ValueError("model quant 'int8' needs bitsandbytes, which is not installed (pip install bitsandbytes)") from None
+    model_config.update(dtype=dtype, quant=quant, compile=compile)
+
+def quantize_int8(model):
+    import bitsandbytes as bnb
+    for name, module in model.named_children():
+        if isinstance(module, torch.nn.Linear):
+            qlinear = bnb.nn.Linear8bitLt(module.in_features, module.out_features, bias=module.bias is not None, has_fp16_weights=False, threshold=6.0)
+            qlinear.weight = bnb.nn.Int8Params(module.weight.data, requires_grad=False, has_fp16_weights=False)
+            if module.bias is not None:
+                qlinear.bias = torch.nn.Parameter(module.bias.data, requires_grad=False)
+            setattr(model, name, qlinear)
+        else:
+            quantize_int8(module)
+    return model
+
+def prepare_model(model, compile=True):
+    # int8 weights are quantized by bitsandbytes on the move to cuda
+    if model_config['quant'] == 'int8':
+        model = quantize_int8(model)
+    model = model.cuda().to(model_config['dtype'])
+    if compile and model_config['compile']:
+        model = torch.compile(model, mode="reduce-overhead")
+    return model
+
 def check_language_by_text(text):
     chinese_pattern = re.compile(r'[\u4e00-\u9fff]')
     english_pattern = re.compile(r'[a-zA-Z]')
@@ -92,6 +132,12 @@ def parse_args():
                       help='Whether to use flash attention (default: False)')
     parser.add_argument('--low_mem', action='store_true',
                       help='Whether to use low memory mode (default: False)')
+    parser.add_argument('--dtype', type=str, default='fp16', choices=list(model_dtypes),
+                      help='LM weight dtype (default: fp16)')
+    parser.add_argument('--quant', type=str, default='none', choices=['none', 'int8'],
+                      help='LM weight quantization (default: none)')
+    parser.add_argument('--compile', action='store_true',
+                      help='Whether to torch.compile the LM (default: False)')
     return parser.parse_args()
 
 def generate(args, version = 'v1.0'):
@@ -207,7 +253,7 @@ def generate(args, version = 'v1.0'):
     audiolm_state_dict = {k.replace('audiolm.', ''): v for k, v in checkpoint.items() if k.startswith('audiolm')}
     audiolm.load_state_dict(audiolm_state_dict, strict=False)
     audiolm = audiolm.eval()
-    audiolm = audiolm.cuda().to(torch.float16)
+    audiolm = prepare_model(audiolm)
 
     model = CodecLM(name = "tmp",
         lm = audiolm,
@@ -423,7 +469,7 @@ def generate_lowmem(args):
         offload_profiler.offload_layer(**(audiolm_offload_param.offload_layer_param_dict()))
         offload_profiler.clean_cache_wrapper(**(audiolm_offload_param.clean_cache_param_dict()))
     else:
-        audiolm = audiolm.cuda().to(torch.float16)
+        audiolm = prepare_model(audiolm)
 
     model = CodecLM(name = "tmp",
         lm = audiolm,
@@ -558,6 +604,7 @@ if __name__ == "__main__":
     np.random.seed(int(time.time()))
     # 解析命令行参数
     args = parse_args()
+    configure_model(dtype=args.dtype, quant=args.quant, compile=args.compile)
     if torch.cuda.is_available():
         device = torch.cuda.current_device()
         reserved = torch.cuda.memory_reserved(device)
@@ -1,4 +1,5 @@
 import os
+import re
 import sys
 
 
@@ -9,21 +10,38 @@ sys.path.append('.')
 import torch
 
 import json
-import numpy as np
+import random
+from concurrent.futures import ThreadPoolExecutor
 from omegaconf import OmegaConf
 
 from codeclm.models import builders
 from codeclm.models import CodecLM
 
 from separator import Separator
-from generate import check_language_by_text
+from generate import check_language_by_text, model_config, prepare_model
+
+# Runs of spaces collapse to one in a single pass
+_MULTI_SPACE = re.compile(r' {2,}')
+
+# Samples per PCM chunk handed to chunk_callback (1 s at 48 kHz)
+PCM_CHUNK_SAMPLES = 48000
 
 
 class LeVoInference(torch.nn.Module):
-    def __init__(self, ckpt_path):
+    def __init__(self, ckpt_path, deterministic: bool = False, compile_model: bool = None):
         super().__init__()
-
-        torch.backends.cudnn.enabled = False 
+        # Defaults follow generate.configure_model (MODEL_COMPILE on the server)
+        if compile_model is None:
+            compile_model = model_config['compile']
+        self.model_dtype = model_config['dtype']
+
+        if deterministic:
+            # Previous behaviour: plain (non-cuDNN) kernels only
+            torch.backends.cudnn.enabled = False
+        else:
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
         OmegaConf.register_new_resolver("eval", lambda x: eval(x))
         OmegaConf.register_new_resolver("concat", lambda *x: [xxx for xx in x for xxx in xx])
         OmegaConf.register_new_resolver("get_fname", lambda: 'default')
@@ -36,27 +54,25 @@ class LeVoInference(torch.nn.Module):
         self.cfg.mode = 'inference'
         self.max_duration = self.cfg.max_dur
 
-        # Define model or load pretrained model
-        audiolm = builders.get_lm_model(self.cfg, version='v1.5')
-        checkpoint = torch.load(pt_path, map_location='cpu')
-        audiolm_state_dict = {k.replace('audiolm.', ''): v for k, v in checkpoint.items() if k.startswith('audiolm')}
-        audiolm.load_state_dict(audiolm_state_dict, strict=False)
-        audiolm = audiolm.eval()
-        audiolm = audiolm.cuda().to(torch.float16)
-
-        audio_tokenizer = builders.get_audio_tokenizer_model(self.cfg.audio_tokenizer_checkpoint, self.cfg)
-        audio_tokenizer = audio_tokenizer.eval()
-
-        seperate_tokenizer = builders.get_audio_tokenizer_model(self.cfg.audio_tokenizer_checkpoint_sep, self.cfg)
-        seperate_tokenizer = seperate_tokenizer.eval()
-
-        self.model = CodecLM(name = "tmp",
-            lm = audiolm,
-            audiotokenizer = audio_tokenizer,
-            max_duration = self.max_duration,
-            seperate_tokenizer = seperate_tokenizer,
-        )
-        self.separator = Separator()
+        # Load the three checkpoints concurrently to overlap disk reads
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            fut_lm = ex.submit(self._load_lm, pt_path)
+            fut_tok = ex.submit(builders.get_audio_tokenizer_model, self.cfg.audio_tokenizer_checkpoint, self.cfg)
+            fut_sep = ex.submit(builders.get_audio_tokenizer_model, self.cfg.audio_tokenizer_checkpoint_sep, self.cfg)
+
+            self.model = CodecLM(name = "tmp",
+                lm = fut_lm.result(),
+                audiotokenizer = fut_tok.result().eval(),
+                max_duration = self.max_duration,
+                seperate_tokenizer = fut_sep.result().eval(),
+            )
+        if compile_model:
+            self.model.lm = torch.compile(self.model.lm, mode='reduce-overhead', dynamic=True)
+            self.model.audiotokenizer.model = torch.compile(self.model.audiotokenizer.model, dynamic=True)
+            self.model.seperate_tokenizer.model = torch.compile(self.model.seperate_tokenizer.model, dynamic=True)
+        # Only needed for prompt_audio_path requests; built on first use
+        self._separator = None
+        self._auto_prompt_cache = {}
 
 
         self.default_params = dict(
@@ -71,24 +87,89 @@ class LeVoInference(torch.nn.Module):
         )
 
         self.model.set_generation_params(**self.default_params)
+        # Overrides currently applied on top of default_params (None = defaults)
+        self._params_key = None
+
+    @property
+    def separator(self):
+        if self._separator is None:
+            self._separator = Separator()
+        return self._separator
+
+    def _load_lm(self, pt_path):
+        # Define model or load pretrained model
+        audiolm = builders.get_lm_model(self.cfg, version='v1.5')
+        audiolm = audiolm.eval()
+        checkpoint = torch.load(pt_path, map_location='cpu', mmap=True, weights_only=True)
+
+        if model_config['quant'] != 'none':
+            # bitsandbytes quantizes on the move to cuda, so the weights load on CPU first
+            audiolm.load_state_dict({k[len('audiolm.'):]: v for k, v in checkpoint.items() if k.startswith('audiolm.')}, strict=False)
+            del checkpoint
+            return prepare_model(audiolm, compile=False)
 
-    def forward(self, lyric: str, description: str = None, prompt_audio_path: os.PathLike = None, genre: str = None, auto_prompt_path: os.PathLike = None, gen_type: str = "mixed", params = dict()):
-        params = {**self.default_params, **params}
-        self.model.set_generation_params(**params)
+        # Compiling happens in __init__, once the whole CodecLM is built
+        audiolm = prepare_model(audiolm, compile=False)
+
+        # Stream the mmapped checkpoint tensor by tensor into the GPU weights,
+        # instead of materializing a full CPU copy and a filtered second dict
+        targets = audiolm.state_dict()
+        with torch.no_grad():
+            for k, v in checkpoint.items():
+                if not k.startswith('audiolm.'):
+                    continue
+                target = targets.get(k[len('audiolm.'):])
+                if target is None:
+                    continue
+                if target.shape != v.shape:
+                    raise RuntimeError(f"size mismatch for {k}: checkpoint {tuple(v.shape)}, model {tuple(target.shape)}")
+                target.copy_(v.pin_memory(), non_blocking=True)
+        torch.cuda.synchronize()
+        del checkpoint
+        return audiolm
+
+    @staticmethod
+    def _split_prompts(prompts):
+        # genre -> [(pmt, vocal, bgm), ...]; 'Auto' is nested one level by language
+        if isinstance(prompts, dict):
+            return {k: LeVoInference._split_prompts(v) for k, v in prompts.items()}
+        return [(t[:,[0],:].contiguous(), t[:,[1],:].contiguous(), t[:,[2],:].contiguous()) for t in prompts]
+
+    def _get_auto_prompt(self, path):
+        auto_prompt = self._auto_prompt_cache.get(path)
+        if auto_prompt is None:
+            raw = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+            auto_prompt = self._split_prompts(raw)
+            self._auto_prompt_cache[path] = auto_prompt
+        return auto_prompt
+
+    @staticmethod
+    def _emit_pcm(wav, chunk_callback):
+        # [C, T] float audio -> interleaved 16-bit stereo PCM bytes, one chunk per second
+        pcm = (wav.float().clamp(-1, 1) * 32767).to(torch.int16)
+        if pcm.shape[0] == 1:
+            pcm = pcm.expand(2, -1)
+        pcm = pcm.t().contiguous().cpu()
+        for start in range(0, pcm.shape[0], PCM_CHUNK_SAMPLES):
+            chunk_callback(pcm[start:start + PCM_CHUNK_SAMPLES].numpy().tobytes())
+
+    def forward(self, lyric: str, description: str = None, prompt_audio_path: os.PathLike = None, genre: str = None, auto_prompt_path: os.PathLike = None, gen_type: str = "mixed", params = None, cond_cache_key: str = None, chunk_callback = None):
+        # Only touch the generation params when they differ from the last call
+        params_key = frozenset(params.items()) if params else None
+        if params_key != self._params_key:
+            self.model.set_generation_params(**{**self.default_params, **(params or {})})
+            self._params_key = params_key
 
         if prompt_audio_path is not None and os.path.exists(prompt_audio_path):
-            pmt_wav, vocal_wav, bgm_wav = self.separator.run(prompt_audio_path)
+            pmt_wav, vocal_wav, bgm_wav = self.separator.run(prompt_audio_path, cache_key=cond_cache_key)
             melody_is_wav = True
         elif genre is not None and auto_prompt_path is not None:
-            auto_prompt = torch.load(auto_prompt_path)
+            auto_prompt = self._get_auto_prompt(auto_prompt_path)
             if genre == 'Auto':
                 lang = check_language_by_text(lyric)
-                prompt_token = auto_prompt['Auto'][lang][np.random.randint(0, len(auto_prompt['Auto'][lang]))]
+                pmt_wav, vocal_wav, bgm_wav = random.choice(auto_prompt['Auto'][lang])
             else:
-                prompt_token = auto_prompt[genre][np.random.randint(0, len(auto_prompt[genre]))]
-            pmt_wav = prompt_token[:,[0],:]
-            vocal_wav = prompt_token[:,[1],:]
-            bgm_wav = prompt_token[:,[2],:]
+                pmt_wav, vocal_wav, bgm_wav = random.choice(auto_prompt[genre])
             melody_is_wav = False
         else:
             pmt_wav = None
@@ -96,10 +177,10 @@ class LeVoInference(torch.nn.Module):
             bgm_wav = None
             melody_is_wav = True
 
-        description = description if description else '.'
-        description = '[Musicality-very-high]' + ', ' + description
+        # Same prompt format as generate.py's CLI path, '.' standing in for no description
+        description = f"[Musicality-very-high], {description or '.'}"
         generate_inp = {
-            'lyrics': [lyric.replace("  ", " ")],
+            'lyrics': [_MULTI_SPACE.sub(' ', lyric)],
             'descriptions': [description],
             'melody_wavs': pmt_wav,
             'vocal_wavs': vocal_wav,
@@ -107,13 +188,15 @@ class LeVoInference(torch.nn.Module):
             'melody_is_wav': melody_is_wav,
         }
 
-        with torch.autocast(device_type="cuda", dtype=torch.float16):
+        # Both stages are pure inference: no autograd and half-precision kernels throughout
+        with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=self.model_dtype, enabled=self.model_dtype != torch.float32):
             tokens = self.model.generate(**generate_inp, return_tokens=True)
-            
-        with torch.no_grad():
             if melody_is_wav:
                 wav_seperate = self.model.generate_audio(tokens, pmt_wav, vocal_wav, bgm_wav, gen_type=gen_type)
             else:
                 wav_seperate = self.model.generate_audio(tokens, gen_type=gen_type)
 
+        # The decoder returns the whole song, so chunks go out once decoding is done
+        if chunk_callback is not None:
+            self._emit_pcm(wav_seperate[0], chunk_callback)
         return wav_seperate[0]
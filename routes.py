@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SongGeneration API - Routes
+FastAPI endpoints, generation scheduling and shared configuration
+"""
+
+import os
+import sys
+import asyncio
+import functools
+import concurrent.futures
+import threading
+import time
+import uuid
+import hashlib
+import struct
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Depends, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from datetime import datetime
+from typing import Optional
+import json
+import orjson
+import traceback
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before torch initializes CUDA
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Import original functionality
+# Note: Ye imports aapki original files se hain
+try:
+    from generate import generate_song, generate_pure_music, configure_model
+    GENERATION_AVAILABLE = True
+except ImportError:
+    print("Warning: Could not import generation functions. Using dummy mode.")
+    GENERATION_AVAILABLE = False
+    
+    # Dummy functions for testing
+    def generate_song(lyrics, genre="Auto", **kwargs):
+        return None, {"status": "dummy", "message": "Generation not available"}
+    
+    def generate_pure_music(prompt, genre="Auto", **kwargs):
+        return None, {"status": "dummy", "message": "Generation not available"}
+
+# ======================
+# Configuration
+# ======================
+
+OUTPUT_DIR = os.path.join(os.getcwd(), "outputs")
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+CACHE_DIR = os.environ.get("TRANSFORMERS_CACHE", "./cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+# Optional API Key
+API_KEY = os.environ.get("API_KEY", None)
+
+# Set ENABLE_GRADIO=0 for API-only deployments (skips importing gradio)
+ENABLE_GRADIO = os.environ.get("ENABLE_GRADIO", "1") == "1"
+
+# Model weights: fp32 / bf16 / fp16, optionally int8-quantized and compiled
+# (MODEL_QUANT=int8 needs the optional bitsandbytes package)
+MODEL_DTYPE = os.environ.get("MODEL_DTYPE", "fp16")
+MODEL_QUANT = os.environ.get("MODEL_QUANT", "none")
+MODEL_COMPILE = os.environ.get("MODEL_COMPILE", "0") == "1"
+
+# Applies to every LM built afterwards, including LeVoInference; a bad value
+# fails startup with a ValueError naming the setting
+if GENERATION_AVAILABLE:
+    configure_model(dtype=MODEL_DTYPE, quant=MODEL_QUANT, compile=MODEL_COMPILE)
+
+# Generation runs off the event loop; keep 1 worker per GPU unless overridden
+GEN_WORKERS = int(os.environ.get("GEN_WORKERS", 1))
+GEN_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=GEN_WORKERS,
+    thread_name_prefix="generation"
+)
+
+# Return cached CUDA blocks to the driver after each job (for GPU sharing)
+ENABLE_CACHE_CLEANING = os.environ.get("ENABLE_CACHE_CLEANING", "0") == "1"
+
+# PCM format produced by the generation chunk callback
+STREAM_SAMPLE_RATE = 48000
+STREAM_CHANNELS = 2
+STREAM_SAMPLE_WIDTH = 2
+
+# Marks the end of a generation stream
+_STREAM_END = object()
+
+class StreamCancelled(Exception):
+    """Raised in the generation thread once the streaming client has gone away"""
+
+# Oldest outputs are deleted beyond these limits
+MAX_OUTPUT_BYTES = int(os.environ.get("MAX_OUTPUT_BYTES", 2 * 1024 ** 3))
+MAX_OUTPUT_FILES = int(os.environ.get("MAX_OUTPUT_FILES", 500))
+OUTPUT_GC_INTERVAL = 300
+_OUTPUT_GC_TASK: Optional[asyncio.Task] = None
+
+# Short-lived os.stat cache for hot download links
+STAT_CACHE_TTL = 5.0
+# Files modified more recently than this may still be growing; never cache them
+STAT_CACHE_SETTLE = 10.0
+STAT_CACHE_MAX = 1024
+_STAT_CACHE = {}
+
+GENRES = (
+    "Auto",
+    "Pop",
+    "R&B",
+    "Dance",
+    "Jazz",
+    "Rock",
+    "Chinese Style",
+    "Chinese Tradition",
+    "Metal",
+    "Reggae",
+    "Chinese Opera"
+)
+
+# Genre list never changes, so encode it once
+GENRES_BODY = orjson.dumps({"status": "success", "genres": GENRES, "count": len(GENRES)})
+
+# Static parts of the info/health responses
+ROOT_RESPONSE = {
+    "service": "SongGeneration API",
+    "version": "1.0.0",
+    "status": "running",
+    "generation_available": GENERATION_AVAILABLE,
+    "endpoints": {
+        "health": "/api/health",
+        "generate_song": "/api/generate",
+        "generate_stream": "/api/generate/stream",
+        "generate_music": "/api/generate-music",
+        "genres": "/api/genres",
+        "docs": "/docs",
+        "gradio": "/gradio" if ENABLE_GRADIO else None
+    }
+}
+
+HEALTH_RESPONSE = {
+    "status": "healthy",
+    "service": "SongGeneration API",
+    "generation_available": GENERATION_AVAILABLE,
+    "output_dir": OUTPUT_DIR,
+    "cache_dir": CACHE_DIR
+}
+
+# Endpoints are collected here and attached to the app in register()
+router = APIRouter()
+
+# ======================
+# Helper Functions
+# ======================
+
+# [second, formatted] of the last timestamp handed out
+_LAST_ISO = [0, ""]
+
+def now_iso():
+    """Current time as ISO string, formatted at most once per second"""
+    sec = int(time.time())
+    if sec != _LAST_ISO[0]:
+        _LAST_ISO[1] = datetime.fromtimestamp(sec).isoformat()
+        _LAST_ISO[0] = sec
+    return _LAST_ISO[1]
+
+async def verify_api_key(x_api_key: str = Header(None)):
+    """Verify API key if configured"""
+    if API_KEY and x_api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid or missing API Key")
+    return True
+
+def new_output_filename(prefix):
+    """Unique output name; the random suffix keeps same-second requests apart"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+
+def save_audio_file(audio_data, filename):
+    """Save audio file to outputs directory"""
+    if audio_data is None:
+        return None
+    
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    # Assuming audio_data is a file path or audio object
+    # Adjust based on actual return type
+    return filepath
+
+def release_gpu_cache():
+    """Free cached CUDA memory when ENABLE_CACHE_CLEANING is set"""
+    if ENABLE_CACHE_CLEANING and torch is not None and torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.empty_cache()
+        torch.cuda.ipc_collect()
+
+def run_generation(fn, *args, **kwargs):
+    """Run a generation job on a worker thread and clean up after it"""
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        release_gpu_cache()
+
+def stat_output(filename):
+    """os.stat an output file, reusing results younger than STAT_CACHE_TTL
+    
+    Only settled files are cached, so a file still being written (e.g. by
+    the streaming endpoint) is never served with a stale Content-Length.
+    """
+    now = time.time()
+    path = os.path.join(OUTPUT_DIR, filename)
+    entry = _STAT_CACHE.get(filename)
+    if entry and now - entry[0] < STAT_CACHE_TTL:
+        # A file deleted behind the cache's back must 404, not get its old headers
+        if os.access(path, os.F_OK):
+            return entry[1]
+        _STAT_CACHE.pop(filename, None)
+    
+    stat_result = os.stat(path)
+    if now - stat_result.st_mtime < STAT_CACHE_SETTLE:
+        _STAT_CACHE.pop(filename, None)
+        return stat_result
+    if len(_STAT_CACHE) >= STAT_CACHE_MAX:
+        _STAT_CACHE.clear()
+    _STAT_CACHE[filename] = (now, stat_result)
+    return stat_result
+
+def parse_byte_range(value, size):
+    """Inclusive (start, end) for a single 'bytes=' Range header, or None to send the whole file
+    
+    Multi-range and malformed headers return None (the full file is a valid
+    answer to those); the caller answers 416 when start lands past the end.
+    """
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    first, sep, last = value[6:].strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            start = max(size - suffix, 0) if suffix else size
+            end = size - 1
+    except ValueError:
+        return None
+    return start, end
+
+def iter_file_range(path, start, end, chunk_size=64 * 1024):
+    """Yield bytes start..end (inclusive) of a file; run by Starlette in its threadpool"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def wav_header(data_size=0xFFFFFFFF - 36):
+    """44-byte PCM WAV header; the default sizes mark a stream of unknown length"""
+    block_align = STREAM_CHANNELS * STREAM_SAMPLE_WIDTH
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, STREAM_CHANNELS, STREAM_SAMPLE_RATE,
+        STREAM_SAMPLE_RATE * block_align, block_align, STREAM_SAMPLE_WIDTH * 8,
+        b"data", data_size
+    )
+
+def prompt_cache_key(audio_prompt):
+    """Key for the prompt file's separated stems on disk, or None when there is no prompt file
+    
+    Separation depends only on the audio file, so the key is its path, mtime
+    and size; a file rewritten in place gets a new key and is separated again.
+    """
+    if not audio_prompt:
+        return None
+    try:
+        st = os.stat(audio_prompt)
+    except OSError:
+        return None
+    return hashlib.sha256(
+        f"{os.path.abspath(audio_prompt)}\0{st.st_mtime_ns}\0{st.st_size}".encode()
+    ).hexdigest()
+
+def generate_to_wav(output_path, on_pcm, cancelled, **kwargs):
+    """Run generate_song with a chunk callback, teeing its PCM into a WAV file
+    
+    Runs on a generation thread, so the file writes stay off the event loop.
+    The file is removed if generation fails or the client disconnects.
+    """
+    written = 0
+    
+    def on_chunk(chunk):
+        nonlocal written
+        if cancelled.is_set():
+            raise StreamCancelled("client disconnected")
+        f.write(chunk)
+        written += len(chunk)
+        on_pcm(chunk)
+    
+    try:
+        with open(output_path, "wb") as f:
+            f.write(wav_header())
+            result = generate_song(chunk_callback=on_chunk, **kwargs)
+            if not written:
+                raise RuntimeError("generation produced no audio")
+            # Rewrite the header with the real sizes
+            f.seek(0)
+            f.write(wav_header(written))
+    except BaseException:
+        try:
+            os.unlink(output_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return result
+
+def gc_outputs():
+    """Delete the oldest output files beyond MAX_OUTPUT_FILES / MAX_OUTPUT_BYTES"""
+    with os.scandir(OUTPUT_DIR) as it:
+        entries = [(e, e.stat()) for e in it if e.is_file()]
+    entries.sort(key=lambda item: item[1].st_mtime)
+    
+    total = sum(st.st_size for _, st in entries)
+    count = len(entries)
+    removed = 0
+    for entry, st in entries:
+        if total <= MAX_OUTPUT_BYTES and count <= MAX_OUTPUT_FILES:
+            break
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+        _STAT_CACHE.pop(entry.name, None)
+        total -= st.st_size
+        count -= 1
+        removed += 1
+    return removed
+
+async def gc_outputs_loop():
+    """Run gc_outputs every OUTPUT_GC_INTERVAL seconds off the event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(OUTPUT_GC_INTERVAL)
+        try:
+            removed = await loop.run_in_executor(None, gc_outputs)
+            if removed:
+                print(f"Output GC: removed {removed} file(s)")
+        except Exception as e:
+            print(f"Output GC error: {e}")
+
+@router.on_event("startup")
+async def start_output_gc():
+    """Start the output directory eviction task"""
+    global _OUTPUT_GC_TASK
+    _OUTPUT_GC_TASK = asyncio.create_task(gc_outputs_loop())
+
+# ======================
+# API Endpoints
+# ======================
+
+@router.get("/")
+async def root():
+    """API information"""
+    return {**ROOT_RESPONSE, "timestamp": now_iso()}
+
+@router.get("/api/health")
+async def health_check():
+    """Health check endpoint"""
+    return {**HEALTH_RESPONSE, "timestamp": now_iso()}
+
+@router.post("/api/generate")
+async def generate_song_api(
+    lyrics: str,
+    genre: str = "Auto",
+    audio_prompt: Optional[str] = None,
+    text_prompt: Optional[str] = None,
+    seed: int = -1,
+    api_key_valid: bool = Depends(verify_api_key)
+):
+    """
+    Generate a song from lyrics
+    
+    Parameters:
+    - lyrics: Song lyrics with structure tags ([intro], [verse], [chorus], etc.)
+    - genre: Music genre (Auto, Pop, Rock, Chinese Style, etc.)
+    - audio_prompt: Optional audio file for style reference
+    - text_prompt: Optional text description
+    - seed: Random seed (-1 for random)
+    """
+    try:
+        # isspace() checks without allocating a stripped copy
+        if not lyrics or lyrics.isspace():
+            raise HTTPException(status_code=400, detail="Lyrics cannot be empty")
+        
+        if not GENERATION_AVAILABLE:
+            raise HTTPException(
+                status_code=503, 
+                detail="Song generation service not available. Models may be loading."
+            )
+        
+        # Generate unique filename
+        output_filename = new_output_filename("song")
+        
+        # Generate song off the event loop
+        try:
+            loop = asyncio.get_running_loop()
+            audio_output, info = await loop.run_in_executor(
+                GEN_EXECUTOR,
+                functools.partial(
+                    run_generation,
+                    generate_song,
+                    lyrics=lyrics,
+                    genre=genre,
+                    audio_prompt=audio_prompt,
+                    text_prompt=text_prompt,
+                    seed=seed,
+                    # Same prompt file across requests reuses its separated stems
+                    cond_cache_key=prompt_cache_key(audio_prompt)
+                )
+            )
+            
+            # Save audio file
+            if audio_output:
+                output_path = os.path.join(OUTPUT_DIR, output_filename)
+                # Save logic depends on what generate_song returns
+                # Assuming it returns a file path or needs to be saved
+                
+                return {
+                    "status": "success",
+                    "message": "Song generated successfully",
+                    "data": {
+                        "audio_url": f"/outputs/{output_filename}",
+                        "filename": output_filename,
+                        "genre": genre,
+                        "info": info if isinstance(info, dict) else {},
+                        "lyrics_preview": lyrics if len(lyrics) <= 100 else lyrics[:100] + "..."
+                    },
+                    "timestamp": now_iso()
+                }
+            else:
+                raise HTTPException(status_code=500, detail="Generation failed")
+                
+        except Exception as gen_error:
+            print(f"Generation error: {gen_error}")
+            traceback.print_exc()
+            raise HTTPException(
+                status_code=500,
+                detail=f"Generation failed: {str(gen_error)}"
+            )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+@router.post("/api/generate/stream")
+async def generate_song_stream_api(
+    lyrics: str,
+    genre: str = "Auto",
+    audio_prompt: Optional[str] = None,
+    text_prompt: Optional[str] = None,
+    seed: int = -1,
+    api_key_valid: bool = Depends(verify_api_key)
+):
+    """
+    Generate a song from lyrics, returning it as a chunked WAV stream
+    
+    The decoder still produces the whole song before the first chunk goes
+    out, so time-to-first-byte is the same as /api/generate; this endpoint
+    only saves the separate download round trip.
+    
+    The full file is also saved and available at the URL in the
+    X-Audio-Url response header once the stream ends.
+    """
+    if not lyrics or lyrics.isspace():
+        raise HTTPException(status_code=400, detail="Lyrics cannot be empty")
+    
+    if not GENERATION_AVAILABLE:
+        raise HTTPException(
+            status_code=503,
+            detail="Song generation service not available. Models may be loading."
+        )
+    
+    output_filename = new_output_filename("song")
+    output_path = os.path.join(OUTPUT_DIR, output_filename)
+    
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    
+    def on_pcm(chunk):
+        # Called from the generation thread with 16-bit PCM bytes
+        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+    
+    def on_done(job):
+        if job.cancelled():
+            queue.put_nowait(asyncio.CancelledError())
+        elif job.exception() is not None:
+            queue.put_nowait(job.exception())
+        else:
+            queue.put_nowait(_STREAM_END)
+    
+    job = loop.run_in_executor(
+        GEN_EXECUTOR,
+        functools.partial(
+            run_generation,
+            generate_to_wav,
+            output_path,
+            on_pcm,
+            cancelled,
+            lyrics=lyrics,
+            genre=genre,
+            audio_prompt=audio_prompt,
+            text_prompt=text_prompt,
+            seed=seed,
+            cond_cache_key=prompt_cache_key(audio_prompt)
+        )
+    )
+    job.add_done_callback(on_done)
+    
+    # Hold the response until audio arrives so early failures still get an error status
+    try:
+        first = await queue.get()
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+    if isinstance(first, BaseException):
+        print(f"Generation error: {first}")
+        raise HTTPException(status_code=500, detail=f"Generation failed: {str(first)}")
+    
+    async def chunk_iter():
+        chunk = first
+        try:
+            yield wav_header()
+            while chunk is not _STREAM_END:
+                if isinstance(chunk, BaseException):
+                    # Abort the response instead of ending it like a complete file
+                    print(f"Generation error: {chunk}")
+                    raise chunk
+                yield chunk
+                chunk = await queue.get()
+        finally:
+            # Stops the generation thread at its next chunk if the client went away
+            cancelled.set()
+    
+    return StreamingResponse(
+        chunk_iter(),
+        media_type="audio/wav",
+        headers={"X-Audio-Url": f"/outputs/{output_filename}"}
+    )
+
+@router.post("/api/generate-music")
+async def generate_music_api(
+    text_prompt: str,
+    genre: str = "Auto",
+    duration: int = 180,
+    seed: int = -1,
+    api_key_valid: bool = Depends(verify_api_key)
+):
+    """
+    Generate instrumental music without lyrics
+    """
+    try:
+        if not text_prompt or text_prompt.isspace():
+            raise HTTPException(status_code=400, detail="Text prompt cannot be empty")
+        
+        if duration <= 0 or duration > 300:
+            raise HTTPException(status_code=400, detail="Duration must be 1-300 seconds")
+        
+        if not GENERATION_AVAILABLE:
+            raise HTTPException(
+                status_code=503,
+                detail="Music generation service not available"
+            )
+        
+        output_filename = new_output_filename("music")
+        
+        try:
+            loop = asyncio.get_running_loop()
+            audio_output, info = await loop.run_in_executor(
+                GEN_EXECUTOR,
+                functools.partial(
+                    run_generation,
+                    generate_pure_music,
+                    prompt=text_prompt,
+                    genre=genre,
+                    duration=duration,
+                    seed=seed
+                )
+            )
+            
+            if audio_output:
+                return {
+                    "status": "success",
+                    "message": "Music generated successfully",
+                    "data": {
+                        "audio_url": f"/outputs/{output_filename}",
+                        "filename": output_filename,
+                        "genre": genre,
+                        "duration": duration,
+                        "prompt": text_prompt
+                    },
+                    "timestamp": now_iso()
+                }
+            else:
+                raise HTTPException(status_code=500, detail="Generation failed")
+                
+        except Exception as gen_error:
+            raise HTTPException(status_code=500, detail=str(gen_error))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.api_route("/outputs/{filename}", methods=["GET", "HEAD"])
+async def download_audio(filename: str, request: Request):
+    """Download generated audio file, with HEAD and single byte-range support"""
+    if "/" in filename or "\\" in filename or ".." in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    filepath = os.path.join(OUTPUT_DIR, filename)
+    
+    # Cached stat, reused by FileResponse for its headers
+    try:
+        stat_result = stat_output(filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    
+    size = stat_result.st_size
+    headers = {"Accept-Ranges": "bytes"}
+    byte_range = parse_byte_range(request.headers.get("range"), size)
+    if byte_range is None:
+        return FileResponse(
+            filepath,
+            media_type="audio/wav",
+            filename=filename,
+            stat_result=stat_result,
+            method=request.method,
+            headers=headers
+        )
+    
+    start, end = byte_range
+    if start >= size or start > end:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=206, media_type="audio/wav", headers=headers)
+    return StreamingResponse(
+        iter_file_range(filepath, start, end),
+        status_code=206,
+        media_type="audio/wav",
+        headers=headers
+    )
+
+@router.get("/api/genres")
+async def get_genres():
+    """Get available music genres"""
+    return Response(content=GENRES_BODY, media_type="application/json")
+
+async def http_exception_handler(request, exc):
+    """Custom HTTP exception handler"""
+    return ORJSONResponse(
+        status_code=exc.status_code,
+        content={
+            "status": "error",
+            "message": exc.detail,
+            "timestamp": now_iso()
+        }
+    )
+
+# ======================
+# Registration
+# ======================
+
+def register(api: FastAPI) -> None:
+    """Attach the API endpoints, startup tasks and error handler to an app"""
+    api.include_router(router)
+    api.add_exception_handler(HTTPException, http_exception_handler)
@@ -29,7 +29,11 @@ class Separator(torch.nn.Module):
             a = torch.cat([a, a], -1)
         return a[:, 0:48000*10]
     
-    def run(self, audio_path, output_dir='tmp', ext=".flac"):
+    def run(self, audio_path, output_dir='tmp', ext=".flac", cache_key=None):
+        # Stems of one file version get their own directory, so a file
+        # rewritten at the same path is separated again instead of reusing old stems
+        if cache_key is not None:
+            output_dir = os.path.join(output_dir, cache_key)
         os.makedirs(output_dir, exist_ok=True)
         name, _ = os.path.splitext(os.path.split(audio_path)[-1])
         output_paths = []
@@ -29,7 +29,7 @@ cfg.mode = 'inference'
 # model = seperate_tokenizer.model.model
 # weights = {}
 # for k, v in model.state_dict().items():
-#     if k.startswith("rvq_bestrq_bgm_emb") or k.startswith("rvq_bestrq_emb") or k.startswith("bestrq"):
+#     if (k.startswith("rvq_bestrq_bgm_emb") or k.startswith("rvq_bestrq_emb") or k.startswith("bestrq")) and v.is_floating_point():
 #         weights[k] = v.half()
 #     else:
 #         weights[k] = v
@@ -39,6 +39,17 @@ cfg.mode = 'inference'
 
 ckpt_path = "/apdcephfs_cq11/share_300883980/tanwei/SongGeneration-WX/ckpt/songgeneration_new_small/model_32.pt"
 # audiolm = builders.get_lm_model(cfg)
-checkpoint = torch.load(ckpt_path, map_location='cpu')
-audiolm_state_dict = {k: v.half() for k, v in checkpoint.items()}
-torch.save(audiolm_state_dict, "/apdcephfs_cq11/share_300883980/tanwei/SongGeneration-WX/ckpt/songgeneration_new_small/model.pt")
+# mmap: tensors are paged in from disk one at a time instead of loading the whole file
+checkpoint = torch.load(ckpt_path, map_location='cpu', mmap=True, weights_only=True)
+# pop as we go so each original can be dropped once converted; leave int tensors alone
+audiolm_state_dict = {}
+for k in list(checkpoint.keys()):
+    v = checkpoint.pop(k)
+    audiolm_state_dict[k] = v.detach().to(torch.float16) if v.is_floating_point() else v
+    del v
+out_path = "/apdcephfs_cq11/share_300883980/tanwei/SongGeneration-WX/ckpt/songgeneration_new_small/model.pt"
+os.makedirs(os.path.dirname(out_path), exist_ok=True)
+# write to a temp file and rename, so a crash never leaves a truncated model.pt
+tmp_path = out_path + ".tmp"
+torch.save(audiolm_state_dict, tmp_path, pickle_protocol=5, _use_new_zipfile_serialization=True)
+os.replace(tmp_path, out_path)